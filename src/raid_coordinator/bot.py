@@ -1,29 +1,78 @@
 import asyncio
+import bisect
 import discord
 import re
 import traceback
 import pytz
 import urllib.parse
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 
 
 # buffer for busier servers
 MAX_MESSAGES = 10000
 
+# number of discord requests in flight together, to stay clear of rate limits
+MAX_CONCURRENT_REQUESTS = 5
+
 # process level client
 client = discord.Client(max_messages=MAX_MESSAGES)
 
+# held while sending discord requests that run alongside others
+request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+# overwrite letting raid members and viewers see a raid channel, never modified
+RAID_READ_PERMS = discord.PermissionOverwrite(read_messages=True)
+
 # bot specific settings
 settings = None
 
 # list of channels in progress
 locked_channels = set()
 
+# announcement messages by (raid channel id, topic), least recently used first
+MAX_ANNOUNCEMENT_MESSAGES = 256
+announcement_messages = OrderedDict()
+
+# channels by name, by server id
+channels_by_name = dict()
+
+# raid members by channel id, dropped whenever discord reports a change to the channel
+raid_members = dict()
+
+# sorted display names of the raid members by channel id, kept alongside raid_members
+raid_member_names = dict()
+
+# display names of raid creators by channel id, for raids started since the bot started
+raid_creator_names = dict()
+
 # whether to refresh the active raids
 # NB: to handle multiple server, this should be a map from server to constant
 should_refresh_active_raids = True
 
 
+async def limited(coro):
+    """Awaits a discord request once fewer than MAX_CONCURRENT_REQUESTS are in flight.
+
+    Only wrap single requests, a coroutine which itself waits on limited requests could deadlock.
+    """
+    async with request_semaphore:
+        return await coro
+
+
+async def ignore_not_found(coro):
+    """Awaits a discord request, returning None if what it acts on has been deleted."""
+    try:
+        return await coro
+    except discord.NotFound:
+        return None
+
+
+async def gather_limited(coros):
+    """Awaits the discord requests concurrently, MAX_CONCURRENT_REQUESTS at a time, and returns their results in order."""
+    return await asyncio.gather(*(limited(coro) for coro in coros))
+
+
 async def get_or_create_role(server, name, create=False):
     """
     Given a server and of the role:
@@ -53,11 +102,25 @@ async def get_raid_organizer_role(server):
     return role
 
 
+def get_channel_named(server, name):
+    """Gets the first channel on the server with the given name, if any.
+
+    The server's channels are indexed by name on first use, until a channel is created, renamed or deleted.
+    """
+    try:
+        channels = channels_by_name[server.id]
+    except KeyError:
+        channels = channels_by_name[server.id] = dict()
+        for channel in server.channels:
+            channels.setdefault(channel.name, channel)
+    return channels.get(name)
+
+
 def get_active_raids_channel(server):
     """
     Gets the active raids channel.
     """
-    return discord.utils.find(lambda c: c.name == settings.active_raids_channel_name, server.channels)
+    return get_channel_named(server, settings.active_raids_channel_name)
 
 
 def encode_message(creator, message):
@@ -84,7 +147,6 @@ def lookup_raid_channel(message):
 
     Expired channels or other channels will not resolve into raid_channels with this call.
     """
-    server = message.server
     if message.channel_mentions:
         raid_channel = message.channel_mentions[0]
         _, channel_id, message_id = decode_message(raid_channel.topic)
@@ -97,13 +159,7 @@ def get_raid_channels(server):
 
     Raid channels must be named according to the raid_channel_regex param and have all required permissions to be recognized.
     """
-    raid_channels = []
-    rx = re.compile(settings.raid_channel_regex)
-    for channel in server.channels:
-        p = channel.permissions_for(server.me)
-        if rx.search(channel.name) and p.manage_roles and p.manage_messages and p.manage_channels and p.read_messages:
-            raid_channels.append(channel)
-    return raid_channels
+    return [channel for channel in server.channels if is_raid_channel(channel)]
 
 
 #
@@ -134,10 +190,13 @@ def strfdelta(tdelta, fmt):
 
 
 def adjusted_datetime(dt):
-    """Adjusts time to the appropriate timezone depending the server region."""
-    tz = settings.time_zone
-    zone = pytz.timezone(tz)
-    return dt + zone.utcoffset(dt)
+    """Adjusts time to the appropriate timezone depending the server region.
+
+    Naive datetimes are taken to be in UTC, as discord timestamps are.
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(settings.tz)
 
 
 def get_raid_expiration(started_dt):
@@ -160,10 +219,39 @@ def created_by_bot(channel):
 
 
 def get_raid_members(channel):
-    """Gets the raid members in this channel."""
+    """Gets the raid members in this channel.
+
+    The members are read from the channel overwrites the first time, and kept up to date by the bot after that.
+    """
+    try:
+        return raid_members[channel.id]
+    except KeyError:
+        members = read_raid_members(channel)
+        raid_members[channel.id] = members
+        return members
+
+
+def read_raid_members(channel):
+    """Reads the raid members of this channel from its overwrites."""
     return [target for target, _ in channel.overwrites if isinstance(target, discord.User)]
 
 
+def get_raid_member_names(channel):
+    """Gets the display names of the raid members in this channel, in sorted order."""
+    try:
+        return raid_member_names[channel.id]
+    except KeyError:
+        names = sorted(member.display_name for member in get_raid_members(channel))
+        raid_member_names[channel.id] = names
+        return names
+
+
+def forget_raid_members(channel):
+    """Forgets the raid members of this channel, they are read from the overwrites again on next use."""
+    raid_members.pop(channel.id, None)
+    raid_member_names.pop(channel.id, None)
+
+
 def get_raid_start_embed(creator, started_dt, expiration_dt):
     """Constructs an embed for the start of a raid."""
     embed = discord.Embed()
@@ -216,39 +304,65 @@ def get_error_embed(text):
     return embed
 
 
+def embed_from_template(template, fields=()):
+    """Constructs an embed from a template dict, with the given fields ahead of the template's own.
+
+    The template is copied, so the embed can be changed freely.
+    """
+    data = dict(template)
+    fields = list(fields) + [dict(field) for field in template.get('fields', ())]
+    if fields:
+        data['fields'] = fields
+    return discord.Embed.from_data(data)
+
+
+# everything in the busy embed is the same every time
+RAID_BUSY_TEMPLATE = {
+    'type': 'rich',
+    'title': 'All raid channels are busy at the moment.',
+    'description': 'Coordinate this raid in another channel instead. More channels will be available later.',
+    'color': discord.Color.dark_teal().value,
+}
+
+
 def get_raid_busy_embed():
     """Constructs an embed for notifying that all channels are busy."""
-    embed = discord.Embed()
-    embed.color = discord.Color.dark_teal()
-    embed.title = 'All raid channels are busy at the moment.'
-    embed.description = 'Coordinate this raid in another channel instead. More channels will be available later.'
-    return embed
+    return embed_from_template(RAID_BUSY_TEMPLATE)
 
 
-def get_raid_members_embed(members):
-    """Constructs an embed for listing raid members."""
+def get_raid_members_embed(names):
+    """Constructs an embed for listing raid members, given their names in sorted order."""
     embed = discord.Embed()
-    embed.title = "Raid Members ({})".format(len(members))
-    embed.description = "\n".join(sorted(member.display_name for member in members))
+    embed.title = "Raid Members ({})".format(len(names))
+    embed.description = "\n".join(names)
     embed.color = discord.Color.green()
     return embed
 
 
+# the parts of the summary embed which are the same for every raid, the raid details go ahead of the commands
+RAID_SUMMARY_TEMPLATE = {
+    'type': 'rich',
+    'title': 'Welcome to this raid channel!',
+    'color': discord.Color.green().value,
+    'fields': [
+        {'name': 'commands', 'value': 'You can use the following commands:', 'inline': False},
+        {'name': '$leaveraid', 'value': 'Removes you from this raid.', 'inline': False},
+        {'name': '$listraid', 'value': 'Shows all current members of this raid channel.', 'inline': False},
+        {'name': '$endraid', 'value': 'Ends the raid and closes the channel.', 'inline': False},
+        {'name': '$map <address>', 'value': 'Gets a link to directions for the address provided.', 'inline': False},
+    ],
+}
+
+
 def get_raid_summary_embed(creator, channel_name, expiration_dt, text):
     """Constructs an embed for summarizing how to use a raid channel."""
-    embed = discord.Embed()
-    embed.title = 'Welcome to this raid channel!'
+    embed = embed_from_template(RAID_SUMMARY_TEMPLATE, [
+        {'name': 'creator', 'value': creator.display_name, 'inline': True},
+        {'name': 'channel expires', 'value': expiration_dt.strftime(settings.time_format), 'inline': True},
+        {'name': 'raid group', 'value': '@{}'.format(channel_name), 'inline': False},
+    ])
     embed.description = "**{}**".format(text)
-    embed.add_field(name='creator', value=creator.display_name)
-    embed.add_field(name='channel expires', value=expiration_dt.strftime(settings.time_format))
-    embed.add_field(name='raid group', value='@{}'.format(channel_name), inline=False)
-    embed.add_field(name="commands", value="You can use the following commands:", inline=False)
-    embed.add_field(name="$leaveraid", value="Removes you from this raid.", inline=False)
-    embed.add_field(name="$listraid", value="Shows all current members of this raid channel.", inline=False)
-    embed.add_field(name="$endraid", value="Ends the raid and closes the channel.", inline=False)
-    embed.add_field(name="$map <address>", value="Gets a link to directions for the address provided.", inline=False)
     embed.set_footer(text='You can also leave the raid with the {} reaction below.'.format(get_leave_emoji()))
-    embed.color = discord.Color.green()
     return embed
 
 
@@ -257,15 +371,20 @@ def is_raid_start_message(message):
 
     This will evaluate True if there are mentions which match the regex for raid starting.
     """
-    if message.role_mentions:
-        rx = re.compile(settings.raid_start_regex)
-        return any(rx.search(mention.name) for mention in message.role_mentions)
+    if not message.role_mentions:
+        return False
+    return any(settings.raid_start_re.search(mention.name) for mention in message.role_mentions)
 
 
 def is_raid_channel(channel):
     """Whether the channel is a raid channel.
+
+    Only the channel itself is inspected, so this is cheap enough for every message and reaction.
     """
-    return channel and channel in get_raid_channels(channel.server)
+    if channel is None or not settings.raid_channel_re.search(channel.name):
+        return False
+    p = channel.permissions_for(channel.server.me)
+    return p.manage_roles and p.manage_messages and p.manage_channels and p.read_messages
 
 
 def is_open(channel):
@@ -273,14 +392,44 @@ def is_open(channel):
     return channel.topic is None
 
 
+def cache_announcement_message(raid_channel, topic, message):
+    """Remembers the announcement message for a raid channel with the given topic."""
+    key = (raid_channel.id, topic)
+    announcement_messages[key] = message
+    announcement_messages.move_to_end(key)
+    while len(announcement_messages) > MAX_ANNOUNCEMENT_MESSAGES:
+        announcement_messages.popitem(last=False)
+
+
+def forget_announcement_message(raid_channel):
+    """Drops any remembered announcement message for a raid channel."""
+    for key in [key for key in announcement_messages if key[0] == raid_channel.id]:
+        del announcement_messages[key]
+
+
+def forget_deleted_announcement_message(message):
+    """Drops a remembered announcement message once it is deleted, so its raid is cleaned up."""
+    for key in [key for key, cached in announcement_messages.items() if cached.id == message.id]:
+        del announcement_messages[key]
+
+
 async def get_announcement_message(raid_channel):
-    """Gets the message that created this channel."""
+    """Gets the message that created this channel.
+
+    Messages are remembered per channel and topic, so only the first lookup goes to discord.
+    """
+    key = (raid_channel.id, raid_channel.topic)
+    if key in announcement_messages:
+        announcement_messages.move_to_end(key)
+        return announcement_messages[key]
+
     server = raid_channel.server
     _, channel_id, message_id = decode_message(raid_channel.topic)
     try:
         channel = server.get_channel(channel_id)
         if channel:
             message = await client.get_message(channel, message_id)
+            cache_announcement_message(raid_channel, raid_channel.topic, message)
             return message
     except:
         return None  # an error occurred, return None TODO: log here
@@ -311,9 +460,12 @@ def get_available_raid_channel(server):
 
     We may need to wrap function calls to this in a lock.
     """
-    for channel in get_raid_channels(server):
-        if channel not in locked_channels and is_open(channel):
-            return channel
+    return next((channel for channel in get_raid_channels(server) if channel not in locked_channels and is_open(channel)), None)
+
+
+def get_raids_in_progress(server):
+    """Gets the raid channels of the server which are not open, i.e. have a raid going on."""
+    return [channel for channel in get_raid_channels(server) if not is_open(channel)]
 
 
 async def start_raid_group(user, message, description):
@@ -336,6 +488,7 @@ async def start_raid_group(user, message, description):
         try:
             # set the topic
             await client.edit_channel(channel, topic=encode_message(user, message))
+            raid_creator_names[channel.id] = user.display_name
 
             # create a role with the same name as this channel
             role = await client.create_role(server, name=channel.name, mentionable=True)
@@ -348,10 +501,9 @@ async def start_raid_group(user, message, description):
             await client.add_reaction(summary_message, get_leave_emoji())
 
             # set channel permissions to make raid viewers see the raid.
-            perms = discord.PermissionOverwrite(read_messages=True)
             role = await get_raid_viewer_role(server)
             if role is not None:
-                await client.edit_channel_permissions(channel, role, perms)
+                await client.edit_channel_permissions(channel, role, RAID_READ_PERMS)
 
         finally:
             # unlock the channel
@@ -363,11 +515,12 @@ async def start_raid_group(user, message, description):
         return channel
 
 
-async def get_original_creator_name(raid_channel):
+def get_original_creator_name(raid_channel, message):
     """Gets the user who created the raid.
-    Pulls and resolves this information from the announcement embed.
+    Remembered when the raid started, or resolved from the embed of the announcement message.
     """
-    message = await get_announcement_message(raid_channel)
+    if raid_channel.id in raid_creator_names:
+        return raid_creator_names[raid_channel.id]
     if message is not None and message.embeds:
         embed = message.embeds[0]
         fields = embed.get('fields', [])
@@ -375,23 +528,33 @@ async def get_original_creator_name(raid_channel):
             return fields[0]['value']
 
 
-async def end_raid_group(channel):
-    """Ends a raid group."""
+# default for arguments where None is a meaningful value
+_UNSET = object()
+
+
+async def end_raid_group(channel, message=_UNSET, viewer_role=None):
+    """Ends a raid group.
+
+    The announcement message and raid viewer role are looked up unless the caller already has them.
+    A message of None means the announcement is known to be gone.
+    """
     global should_refresh_active_raids
 
     server = channel.server
+    if message is _UNSET:
+        message = await get_announcement_message(channel)
 
     # get the creator before we remove roles
     creator = get_raid_creator(channel)
     original_creator_name = None
     if creator is None:
-        original_creator_name = await get_original_creator_name(channel)
+        original_creator_name = get_original_creator_name(channel, message)
 
     # remove all the permissions
-    role = await get_raid_viewer_role(server)
-    for target, _ in channel.overwrites:
-        if isinstance(target, discord.User) or target == role:
-            await client.delete_channel_permissions(channel, target)
+    if viewer_role is None:
+        viewer_role = await get_raid_viewer_role(server)
+    targets = [target for target, _ in channel.overwrites if isinstance(target, discord.User) or target == viewer_role]
+    await gather_limited(client.delete_channel_permissions(channel, target) for target in targets)
 
     # remove the role
     role = get_raid_role(channel)
@@ -401,18 +564,21 @@ async def end_raid_group(channel):
         except:
             print('Unable to delete role, it was already removed {}.'.format(role.name))
 
-    # purge all messages
-    await client.purge_from(channel)
-
-    # update the message if its available
-    message = await get_announcement_message(channel)
+    # purge all messages, and update the message if its available
+    requests = [client.purge_from(channel)]
     if message is not None:
         started_dt = adjusted_datetime(message.timestamp)
         ended_dt = adjusted_datetime(datetime.utcnow())
-        await client.edit_message(message, embed=get_raid_end_embed(creator, started_dt, ended_dt, original_creator_name))
-        await client.clear_reactions(message)
+        # the message may have been deleted since, which should not stop the teardown
+        embed = get_raid_end_embed(creator, started_dt, ended_dt, original_creator_name)
+        requests.append(ignore_not_found(client.edit_message(message, embed=embed)))
+        requests.append(ignore_not_found(client.clear_reactions(message)))
+    await gather_limited(requests)
 
     # remove the topic
+    forget_announcement_message(channel)
+    forget_raid_members(channel)
+    raid_creator_names.pop(channel.id, None)
     channel = await client.edit_channel(channel, topic=None)
 
     # refresh the raids
@@ -431,18 +597,21 @@ async def invite_user_to_raid(channel, user):
     should_refresh_active_raids = True
 
     # adds an overwrite for the user
-    perms = discord.PermissionOverwrite(read_messages=True)
-    await client.edit_channel_permissions(channel, user, perms)
-
-    # invite user to role
+    await client.edit_channel_permissions(channel, user, RAID_READ_PERMS)
+    members = raid_members.get(channel.id)
+    if members is not None and user not in members:
+        members.append(user)
+        if channel.id in raid_member_names:
+            bisect.insort(raid_member_names[channel.id], user.display_name)
+
+    # sends a message to the raid channel the user was added, and invites the user to the role
+    requests = [client.send_message(channel,
+                                    "{}, you are now a member of this raid group.".format(user.mention),
+                                    embed=get_success_embed('{} has joined the raid!'.format(user.display_name)))]
     role = get_raid_role(channel)
     if role:
-        await client.add_roles(user, role)
-
-    # sends a message to the raid channel the user was added
-    await client.send_message(channel,
-                              "{}, you are now a member of this raid group.".format(user.mention),
-                              embed=get_success_embed('{} has joined the raid!'.format(user.display_name)))
+        requests.append(client.add_roles(user, role))
+    await gather_limited(requests)
 
 
 async def uninvite_user_from_raid(channel, user):
@@ -458,18 +627,36 @@ async def uninvite_user_from_raid(channel, user):
 
     # reflect the proper number of members (the bot role and everyone are excluded)
     await client.delete_channel_permissions(channel, user)
-    await client.send_message(channel, embed=get_error_embed('{} has the left raid!'.format(user.display_name)))
+    members = raid_members.get(channel.id)
+    if members is not None and user in members:
+        members.remove(user)
+        names = raid_member_names.get(channel.id)
+        if names is not None:
+            if user.display_name in names:
+                names.remove(user.display_name)
+            else:
+                # the name changed without discord telling us, sort the names again on next use
+                del raid_member_names[channel.id]
 
-    # delete user from role
+    # say so, delete user from role and remove the messages emoji
+    # remove_join_reaction limits its own requests, so it is gathered as is
+    requests = [limited(client.send_message(channel, embed=get_error_embed('{} has the left raid!'.format(user.display_name)))),
+                remove_join_reaction(channel, user)]
     role = get_raid_role(channel)
     if role:
-        await client.remove_roles(user, role)
+        requests.append(limited(client.remove_roles(user, role)))
+    await asyncio.gather(*requests)
 
-    # remove the messages emoji
-    server = channel.server
-    announcement_message = await get_announcement_message(channel)
+
+async def remove_join_reaction(channel, user):
+    """Removes the user's join reaction from the announcement of the raid channel."""
+    announcement_message = await limited(get_announcement_message(channel))
     if announcement_message is not None:
-        await client.remove_reaction(announcement_message, get_join_emoji(), user)
+        try:
+            await limited(client.remove_reaction(announcement_message, get_join_emoji(), user))
+        except discord.NotFound:
+            # deleted without discord.py telling us, forget it so the cleanup task ends the raid
+            forget_announcement_message(channel)
 
 
 async def post_google_maps_directions(channel, address):
@@ -492,12 +679,15 @@ async def post_google_maps_directions(channel, address):
 
 async def list_raid_members(channel):
     """Lists the members of a raid channel in the channel."""
-    members = get_raid_members(channel)
-    await client.send_message(channel, embed=get_raid_members_embed(members))
+    names = get_raid_member_names(channel)
+    await client.send_message(channel, embed=get_raid_members_embed(names))
+
 
+async def list_active_raids(server, raids=None):
+    """Lists the active raids in the active raids channel.
 
-async def list_active_raids(server):
-    """Lists the active raids in the active raids channel."""
+    The raids in progress are looked up unless the caller already has them.
+    """
     # gets the channel where active raids are found
     channel = get_active_raids_channel(server)
 
@@ -506,7 +696,9 @@ async def list_active_raids(server):
         return
 
     # gets all current active raids
-    active_raid_channels = [(rc, get_raid_members(rc)) for rc in get_raid_channels(server) if not is_open(rc)]
+    if raids is None:
+        raids = get_raids_in_progress(server)
+    active_raid_channels = [(rc, get_raid_members(rc)) for rc in raids]
 
     # purges the current list of raids
     await client.purge_from(channel)
@@ -547,23 +739,46 @@ async def cleanup_raid_channels():
     await client.wait_until_ready()
     while not client.is_closed:
         try:
+            # check every raid in progress at once, then end the expired ones together
+            raids_by_server = {server: get_raids_in_progress(server) for server in client.servers}
+            channels = [channel for raids in raids_by_server.values() for channel in raids if channel not in locked_channels]
+            messages = await gather_limited(get_announcement_message(channel) for channel in channels)
+            expired = [(channel, message) for channel, message in zip(channels, messages)
+                       if is_expired(message) or (not created_by_bot(channel) and not get_raid_members(channel))]
+
+            # resolve the viewer role up front, concurrent teardowns would each create a missing one
+            viewer_roles = dict()
+            for server in {channel.server for channel, _ in expired}:
+                viewer_roles[server] = await get_raid_viewer_role(server)
+
+            # not limited as a whole, end_raid_group limits its own requests
+            results = await asyncio.gather(*(end_raid_group(channel, message, viewer_roles[channel.server])
+                                             for channel, message in expired),
+                                           return_exceptions=True)
+            ended_channels = set()
+            for (channel, _), result in zip(expired, results):
+                if isinstance(result, Exception):
+                    print('Unable to end the raid in {}:'.format(channel.name))
+                    traceback.print_exception(type(result), result, result.__traceback__)
+                else:
+                    ended_channels.add(channel)
+
             for server in client.servers:
-                channels = get_raid_channels(server)
-                for channel in channels:
-                    if channel not in locked_channels and not is_open(channel):
-                        message = await get_announcement_message(channel)
-                        if is_expired(message) or (not created_by_bot(channel) and not get_raid_members(channel)):
-                            await end_raid_group(channel)
+                # look again, raids may have started meanwhile, and the topics of the raids just ended may not have caught up yet
+                raids = [channel for channel in get_raids_in_progress(server) if channel not in ended_channels]
 
                 # refresh the active raids if it has been too long
-                raids_in_progress = any(not is_open(channel) for channel in channels)
-                if raids_in_progress and datetime.utcnow() - last_active_raid_refresh_time > max_active_raids_channel_age:
+                if raids and datetime.utcnow() - last_active_raid_refresh_time > max_active_raids_channel_age:
                     should_refresh_active_raids = True
 
-                # list the active raids every cycle
+                # list the active raids every cycle, raids changing while listing ask for another refresh
                 if should_refresh_active_raids:
-                    await list_active_raids(server)
                     should_refresh_active_raids = False
+                    try:
+                        await list_active_raids(server, raids)
+                    except:
+                        should_refresh_active_raids = True
+                        raise
                     last_active_raid_refresh_time = datetime.utcnow()
 
         except:
@@ -578,6 +793,12 @@ async def on_ready():
     print('Logged in as {}'.format(client.user.name))
     print('------')
 
+    # every server, channel and member is rebuilt on each (re)connect, and events may have been missed
+    channels_by_name.clear()
+    raid_members.clear()
+    raid_member_names.clear()
+    announcement_messages.clear()
+
     for server in client.servers:
         print('server: {}'.format(server.name))
 
@@ -605,6 +826,82 @@ async def on_ready():
             print('active raids channel: {}'.format(channel.name))
 
 
+def forget_server(server):
+    """Forgets the discord objects cached for a server and its channels."""
+    channels_by_name.pop(server.id, None)
+    for channel in server.channels:
+        forget_raid_members(channel)
+        forget_announcement_message(channel)
+
+
+@client.event
+async def on_server_remove(server):
+    """Drops the state kept for a server the bot has left or been removed from."""
+    forget_server(server)
+    for channel in server.channels:
+        raid_creator_names.pop(channel.id, None)
+
+
+@client.event
+async def on_server_available(server):
+    """Drops the state cached during an outage, the server comes back with new channel and member objects."""
+    forget_server(server)
+
+
+@client.event
+async def on_channel_create(channel):
+    """Reindexes the server channels once a new one shows up."""
+    if not channel.is_private:
+        channels_by_name.pop(channel.server.id, None)
+
+
+@client.event
+async def on_channel_update(before, after):
+    """Forgets the raid members of a channel once its overwrites no longer match them.
+
+    The bot's own joins and leaves are already reflected, so their updates keep the sorted names.
+    """
+    members = raid_members.get(after.id)
+    if members is not None and {member.id for member in members} != {member.id for member in read_raid_members(after)}:
+        forget_raid_members(after)
+    if not after.is_private and before.name != after.name:
+        channels_by_name.pop(after.server.id, None)
+
+
+@client.event
+async def on_channel_delete(channel):
+    """Forgets everything known about a deleted channel."""
+    forget_raid_members(channel)
+    raid_creator_names.pop(channel.id, None)
+    forget_announcement_message(channel)
+    if not channel.is_private:
+        channels_by_name.pop(channel.server.id, None)
+
+
+@client.event
+async def on_message_delete(message):
+    """Forgets a deleted announcement message."""
+    forget_deleted_announcement_message(message)
+
+
+@client.event
+async def on_member_update(before, after):
+    """Forgets the sorted raid member names once someone's display name changes."""
+    if before.display_name != after.display_name:
+        raid_member_names.clear()
+
+
+def get_joined_raid_channel(reaction):
+    """Gets the raid channel a join reaction is for.
+
+    Returns None unless the reaction is the join emoji on a message announcing an active raid channel.
+    """
+    if reaction.emoji == get_join_emoji():
+        raid_channel = lookup_raid_channel(reaction.message)
+        if is_raid_channel(raid_channel):
+            return raid_channel
+
+
 @client.event
 async def on_reaction_add(reaction, user):
     """Invites a user to a raid channel they react to they are no already there."""
@@ -613,13 +910,12 @@ async def on_reaction_add(reaction, user):
     if user == server.me:
         return
 
-    if reaction.emoji == get_join_emoji():
-        raid_channel = lookup_raid_channel(message)
-        if is_raid_channel(raid_channel):
-            # NB: use overwrites for, since admins otherwise won't be notified
-            # we know the channel is private and only overwrites matter
-            if raid_channel.overwrites_for(user).is_empty():
-                await invite_user_to_raid(raid_channel, user)
+    raid_channel = get_joined_raid_channel(reaction)
+    if raid_channel is not None:
+        # NB: use overwrites for, since admins otherwise won't be notified
+        # we know the channel is private and only overwrites matter
+        if raid_channel.overwrites_for(user).is_empty():
+            await invite_user_to_raid(raid_channel, user)
 
     elif reaction.emoji == get_leave_emoji():
         raid_channel = message.channel
@@ -627,27 +923,43 @@ async def on_reaction_add(reaction, user):
             # NB: use overwrites for, since admins otherwise won't be notified
             # we know the channel is private and only overwrites matter
             if not raid_channel.overwrites_for(user).is_empty():
-                await uninvite_user_from_raid(raid_channel, user)
-
-                # remove this reaction
-                await client.remove_reaction(message, reaction.emoji, user)
+                # remove this reaction as well
+                await asyncio.gather(uninvite_user_from_raid(raid_channel, user),
+                                     limited(client.remove_reaction(message, reaction.emoji, user)))
 
 
 @client.event
 async def on_reaction_remove(reaction, user):
     """Uninvites a user to a raid when they remove a reaction if they are there."""
     server = reaction.message.server
-    message = reaction.message
     if user == server.me:
         return
 
-    if reaction.emoji == get_join_emoji():
-        raid_channel = lookup_raid_channel(message)
-        if is_raid_channel(raid_channel):
-            # NB: use overwrites for, since admins otherwise won't be notified
-            # we know the channel is private and only overwrites matter
-            if not raid_channel.overwrites_for(user).is_empty():
-                await uninvite_user_from_raid(raid_channel, user)
+    raid_channel = get_joined_raid_channel(reaction)
+    if raid_channel is not None:
+        # NB: use overwrites for, since admins otherwise won't be notified
+        # we know the channel is private and only overwrites matter
+        if not raid_channel.overwrites_for(user).is_empty():
+            await uninvite_user_from_raid(raid_channel, user)
+
+
+async def end_raid_for_user(channel, user):
+    """Ends the raid if the user is its creator or a raid organizer."""
+    role = await get_raid_organizer_role(channel.server)
+    is_organizer = role is not None and role in user.roles
+    if is_organizer or user == get_raid_creator(channel):
+        await end_raid_group(channel)
+    else:
+        await client.send_message(channel, embed=get_error_embed('Only the creator or raid organizer may end the raid.'))
+
+
+# commands available in raid channels, each called with the channel and the user
+RAID_COMMANDS = {
+    '$leaveraid': uninvite_user_from_raid,
+    '$listraid': lambda channel, user: list_raid_members(channel),
+    '$endraid': end_raid_for_user,
+}
+
 
 @client.event
 async def on_message(message):
@@ -658,6 +970,10 @@ async def on_message(message):
     if user == server.me:
         return
 
+    # only commands and role mentions do anything, so skip all other chatter early
+    if not message.role_mentions and not message.content.startswith('$'):
+        return
+
     # try simple commands first
     perms = channel.permissions_for(server.me)
 
@@ -671,7 +987,7 @@ async def on_message(message):
     if not perms.manage_messages:
         return
 
-    if channel not in get_raid_channels(server) and is_raid_start_message(message):
+    if not is_raid_channel(channel) and is_raid_start_message(message):
         # send the message, then edit the raid to avoid a double notification
         raid_message = await client.send_message(channel, "Looking for open channels...")
         raid_channel = await start_raid_group(user, raid_message, message.clean_content)
@@ -681,33 +997,19 @@ async def on_message(message):
             raid_message = await client.edit_message(raid_message,
                                                      '**{}**\n**in:** {}'.format(message.clean_content, raid_channel.mention),
                                                      embed=get_raid_start_embed(user, started_dt, expiration_dt))
+            cache_announcement_message(raid_channel, encode_message(user, raid_message), raid_message)
 
-            # invite the member
-            await invite_user_to_raid(raid_channel, user)
-
-            # add a join reaction to the message
-            join_emoji = get_join_emoji()
-            await client.add_reaction(raid_message, join_emoji)
+            # invite the member, and add a join reaction to the message
+            await asyncio.gather(invite_user_to_raid(raid_channel, user),
+                                 limited(client.add_reaction(raid_message, get_join_emoji())))
         else:
             m = await client.edit_message(raid_message, "", embed=get_raid_busy_embed())
             await client.add_reaction(m, get_full_emoji())
-    elif is_raid_channel(channel) and message.content.startswith('$leaveraid'):
-        await uninvite_user_from_raid(channel, user)
-
-    elif is_raid_channel(channel) and message.content.startswith('$listraid'):
-        await list_raid_members(channel)
-
-    elif is_raid_channel(channel) and message.content.startswith('$endraid'):
-        role = await get_raid_organizer_role(server)
-        is_organizer = role is not None and role in user.roles
-        if is_organizer:
-            await end_raid_group(channel)
-        else:
-            creator = get_raid_creator(channel)
-            if user == creator:
-                await end_raid_group(channel)
-            else:
-                await client.send_message(channel, embed=get_error_embed('Only the creator or raid organizer may end the raid.'))
+    elif is_raid_channel(channel):
+        words = message.content.split(None, 1)
+        command = RAID_COMMANDS.get(words[0]) if words else None
+        if command is not None:
+            await command(channel, user)
 
 
 def get_args():
@@ -744,5 +1046,11 @@ def get_args():
 def main():
     global settings
     settings = get_args()
+
+    # compile the patterns once, they are checked on every message
+    settings.raid_channel_re = re.compile(settings.raid_channel_regex)
+    settings.raid_start_re = re.compile(settings.raid_start_regex)
+    settings.tz = pytz.timezone(settings.time_zone)
+
     client.loop.create_task(cleanup_raid_channels())
     client.run(settings.token)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import discord
 import hypothesis.strategies as st
+import pytz
 import unittest
 import unittest.mock as mock
 import raid_coordinator.bot as bot
@@ -32,3 +35,189 @@ class TestRaidExpiration(unittest.TestCase):
         message = mock.Mock(timestamp=message_ts)
         with mock.patch('raid_coordinator.bot.settings', new=mock.Mock(raid_duration_seconds=seconds)):
             self.assertFalse(bot.is_expired(message))
+
+
+class TestAdjustedDatetime(unittest.TestCase):
+    """Tests around displaying times in the configured time zone."""
+
+    def setUp(self):
+        patcher = mock.patch('raid_coordinator.bot.settings', new=mock.Mock(tz=pytz.timezone('US/Eastern')))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_adjusted_datetime_summer(self):
+        """
+        Should shift UTC by the daylight saving offset in summer.
+        """
+        dt = bot.adjusted_datetime(datetime(2017, 7, 1, 16, 0))
+        self.assertEqual(dt.strftime('%Y-%m-%d %H:%M'), '2017-07-01 12:00')
+
+    def test_adjusted_datetime_winter(self):
+        """
+        Should shift UTC by the standard offset in winter.
+        """
+        dt = bot.adjusted_datetime(datetime(2017, 12, 1, 16, 0))
+        self.assertEqual(dt.strftime('%Y-%m-%d %H:%M'), '2017-12-01 11:00')
+
+    def test_adjusted_datetime_ambiguous(self):
+        """
+        Should resolve times which are ambiguous on the local clock.
+        """
+        first = bot.adjusted_datetime(datetime(2017, 11, 5, 5, 30))
+        second = bot.adjusted_datetime(datetime(2017, 11, 5, 6, 30))
+        self.assertEqual(first.strftime('%H:%M'), '01:30')
+        self.assertEqual(second.strftime('%H:%M'), '01:30')
+        self.assertEqual(second - first, timedelta(hours=1))
+
+
+class TestAnnouncementMessageCache(unittest.TestCase):
+    """Tests around remembering announcement messages."""
+
+    def setUp(self):
+        patcher = mock.patch.dict('raid_coordinator.bot.announcement_messages', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_bounded(self):
+        """
+        Should evict the least recently used message when full.
+        """
+        channels = [mock.Mock(id=str(i)) for i in range(3)]
+        with mock.patch('raid_coordinator.bot.MAX_ANNOUNCEMENT_MESSAGES', new=2):
+            bot.cache_announcement_message(channels[0], 'topic', mock.Mock())
+            bot.cache_announcement_message(channels[1], 'topic', mock.Mock())
+            bot.cache_announcement_message(channels[0], 'topic', mock.Mock())
+            bot.cache_announcement_message(channels[2], 'topic', mock.Mock())
+        self.assertEqual(list(bot.announcement_messages), [('0', 'topic'), ('2', 'topic')])
+
+    def test_cache_hit(self):
+        """
+        Should return the remembered message for the channel topic without fetching it.
+        """
+        channel = mock.Mock(id='1', topic='topic')
+        message = mock.Mock()
+        bot.cache_announcement_message(channel, 'topic', message)
+        with mock.patch('raid_coordinator.bot.client') as client:
+            result = asyncio.get_event_loop().run_until_complete(bot.get_announcement_message(channel))
+        self.assertIs(result, message)
+        client.get_message.assert_not_called()
+
+    def test_forget_channel(self):
+        """
+        Should forget the messages of every topic of the channel, and only that channel.
+        """
+        channel = mock.Mock(id='1')
+        other = mock.Mock(id='2')
+        bot.cache_announcement_message(channel, 'old', mock.Mock())
+        bot.cache_announcement_message(channel, 'new', mock.Mock())
+        bot.cache_announcement_message(other, 'topic', mock.Mock())
+        bot.forget_announcement_message(channel)
+        self.assertEqual(list(bot.announcement_messages), [('2', 'topic')])
+
+    def test_forget_deleted_message(self):
+        """
+        Should forget a message once discord reports it deleted.
+        """
+        channel = mock.Mock(id='1')
+        other = mock.Mock(id='2')
+        bot.cache_announcement_message(channel, 'topic', mock.Mock(id='10'))
+        bot.cache_announcement_message(other, 'topic', mock.Mock(id='20'))
+        asyncio.get_event_loop().run_until_complete(bot.on_message_delete(mock.Mock(id='10')))
+        self.assertEqual(list(bot.announcement_messages), [('2', 'topic')])
+
+    def test_forget_message_not_found(self):
+        """
+        Should forget a message which turns out to be deleted when removing a reaction from it.
+        """
+        channel = mock.Mock(id='1', topic='topic')
+        bot.cache_announcement_message(channel, 'topic', mock.Mock(id='10'))
+        client = mock.Mock()
+        client.remove_reaction.side_effect = discord.NotFound(mock.Mock(), 'Unknown Message')
+        with mock.patch('raid_coordinator.bot.client', new=client), \
+                mock.patch('raid_coordinator.bot.settings', new=mock.Mock()):
+            asyncio.get_event_loop().run_until_complete(bot.remove_join_reaction(channel, mock.Mock()))
+        self.assertEqual(list(bot.announcement_messages), [])
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+class TestRaidMemberNames(unittest.TestCase):
+    """Tests around keeping the names of raid members sorted."""
+
+    def setUp(self):
+        client = mock.Mock()
+        for name in ('edit_channel_permissions', 'delete_channel_permissions', 'send_message', 'add_roles', 'remove_roles'):
+            setattr(client, name, mock.Mock(side_effect=noop))
+        for patcher in (mock.patch.dict('raid_coordinator.bot.raid_members', clear=True),
+                        mock.patch.dict('raid_coordinator.bot.raid_member_names', clear=True),
+                        mock.patch('raid_coordinator.bot.client', new=client),
+                        mock.patch('raid_coordinator.bot.get_announcement_message', new=noop)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = client
+
+    def member(self, name):
+        return mock.Mock(spec=discord.User, id=name, display_name=name, mention='@' + name, bot=False)
+
+    def channel(self, *members):
+        return mock.Mock(id='1', overwrites=[(member, mock.Mock()) for member in members], server=mock.Mock(roles=[]))
+
+    def run_coroutine(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def test_invite_keeps_names_sorted(self):
+        """
+        Should insert the name of an invited member in sorted order.
+        """
+        channel = self.channel(self.member('carol'), self.member('alice'))
+        self.assertEqual(bot.get_raid_member_names(channel), ['alice', 'carol'])
+        self.run_coroutine(bot.invite_user_to_raid(channel, self.member('bob')))
+        self.assertEqual(bot.get_raid_member_names(channel), ['alice', 'bob', 'carol'])
+
+    def test_uninvite_removes_name(self):
+        """
+        Should remove the name of an uninvited member.
+        """
+        alice, bob = self.member('alice'), self.member('bob')
+        channel = self.channel(alice, bob)
+        self.assertEqual(bot.get_raid_member_names(channel), ['alice', 'bob'])
+        self.run_coroutine(bot.uninvite_user_from_raid(channel, alice))
+        self.assertEqual(bot.get_raid_member_names(channel), ['bob'])
+
+    def test_uninvite_renamed_member(self):
+        """
+        Should still uninvite a member whose name changed unnoticed, and sort the names again.
+        """
+        member = self.member('old')
+        channel = self.channel(member)
+        self.assertEqual(bot.get_raid_member_names(channel), ['old'])
+        member.display_name = 'new'
+        self.run_coroutine(bot.uninvite_user_from_raid(channel, member))
+        self.assertTrue(self.client.send_message.called)
+        self.assertEqual(bot.get_raid_member_names(channel), [])
+
+    def test_channel_update_matching_members(self):
+        """
+        Should keep the sorted names when the overwrites match the members the bot knows about.
+        """
+        alice, bob = self.member('alice'), self.member('bob')
+        channel = self.channel(alice)
+        bot.get_raid_member_names(channel)
+        self.run_coroutine(bot.invite_user_to_raid(channel, bob))
+        names = bot.raid_member_names[channel.id]
+        channel.overwrites = [(alice, mock.Mock()), (bob, mock.Mock())]
+        self.run_coroutine(bot.on_channel_update(channel, channel))
+        self.assertIs(bot.get_raid_member_names(channel), names)
+
+    def test_channel_update_changed_members(self):
+        """
+        Should read the members again when the overwrites changed behind the bot's back.
+        """
+        alice, bob = self.member('alice'), self.member('bob')
+        channel = self.channel(alice)
+        self.assertEqual(bot.get_raid_member_names(channel), ['alice'])
+        channel.overwrites = [(alice, mock.Mock()), (bob, mock.Mock())]
+        self.run_coroutine(bot.on_channel_update(channel, channel))
+        self.assertEqual(bot.get_raid_member_names(channel), ['alice', 'bob'])